@@ -1,17 +1,35 @@
 #! /usr/bin/env python
+# PyOpenGL checks glGetError after every single call and logs them: that's most of its per-call overhead.
+# Both must be turned off before importing OpenGL.GL (set ERROR_CHECKING back to True to debug GL errors)
+import OpenGL
+OpenGL.ERROR_CHECKING = False
+OpenGL.ERROR_LOGGING = False
+
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
+from OpenGL.GL.EXT.texture_filter_anisotropic import *
+from OpenGL.GL import shaders
 from PIL.Image import *
+import ctypes
+import math
+import time
+import numpy as np
 
 # ------------------------------
 # GLOBAL CONSTANTS AND VARIABLES
 # ------------------------------
 
 # Rotation variables: define the main rotation speed for elements in the scene
+# (delta_rot is the rotation for every frame at the target frame rate)
 zrot = 0.0
 delta_rot = 0.05
 
+# Target frame rate, interval between redraws (in milliseconds) and time of the last drawn frame
+TARGET_HZ = 60
+frame_interval = 1000 // TARGET_HZ
+last_time = 0.0
+
 # Properties for the Sky Dome
 # Radius and center
 distance_limit = 100
@@ -26,6 +44,7 @@ star_distance = 0.7
 
 # Safety radius: the observer can't escape this boundary. Max distance from the "sky dome center"
 safety_radius = sky_radius * 2 / 3
+safety_radius_sq = safety_radius * safety_radius
 
 # Planet and satellite radius, tilt, orbit planes, speed modifiers...
 planet_radius = 1.3
@@ -35,14 +54,83 @@ satellite_radius = 0.3
 satellite_distance_from_planet_center = 4
 satellite_angular_speed_modifier = -3
 
+# Levels of detail of the planet: (maximum distance from the eye, slices and stacks of its sphere).
+# The last level is used at any greater distance
+planet_lod = [(5, 48), (20, 24), (None, 12)]
+
+# Size of the rose, which also gives the size of the glass bowl over it
+rose_width = 0.5
+rose_height = 0.8
+
+# Degrees to radians conversion factor
+DEG2RAD = math.pi / 180.0
+
 # Camera (eye) position, direction (also with phi and theta angles for direction and tilt)
 phi = 0.0
 theta = 0.0
+# Sine and cosine of the camera angles, updated only when the angles change
+sin_theta, cos_theta, sin_phi = 0.0, 1.0, 0.0
+# True when the eye position or the camera angles changed and eye_direction must be recomputed
+camera_dirty = True
 eye = [0.0, 0.0, 8.0]
 eye_direction = [0.0, 5.0, 50.0]
 # Grain of camera turning
 eye_rotation_delta = 5
 
+# Maximum size of the texture atlas which holds all the textures with alpha channel,
+# and border (filled with copies of the edge texels) left around every texture in it (in pixels)
+atlas_size = (2048, 2048)
+atlas_padding = 8
+
+# Vertex buffers of the crossed rectangles, indexed by (w, h, faces, uv_rect)
+crossed_quads_cache = {}
+
+# Fragment shader for the transparent objects: fully transparent texels are discarded,
+# the others are blended with the lit color computed by the fixed-function pipeline
+SPRITE_FRAGMENT_SHADER = """
+#version 120
+uniform sampler2D tex;
+
+void main()
+{
+    vec4 c = texture2D(tex, gl_TexCoord[0].xy);
+    if (c.a < 0.01)
+        discard;
+    gl_FragColor = c * gl_Color;
+}
+"""
+
+# Material parameters, pre-built as GLfloat arrays so that they aren't converted on every call
+PLANET_AMBIENT = (GLfloat * 4)(0.1, 0.1, 0.1, 1.0)
+PLANET_DIFFUSE = (GLfloat * 4)(10, 10, 10, 1.0)
+PLANET_SPECULAR = (GLfloat * 4)(5, 5, 5, 1.0)
+PLANET_EMISSION = (GLfloat * 4)(0, 0, 0, 1.0)
+
+DULL_FRONT_AMBIENT = (GLfloat * 4)(0.1, 0.1, 0.1, 1.0)
+DULL_FRONT_DIFFUSE = (GLfloat * 4)(1, 1, 1, 1.0)
+DULL_FRONT_SPECULAR = (GLfloat * 4)(0.1, 0.1, 0.1, 1.0)
+DULL_FRONT_EMISSION = (GLfloat * 4)(0.0, 0.0, 0.0, 1.0)
+DULL_BACK_AMBIENT = (GLfloat * 4)(0.1, 0.1, 0.1, 1.0)
+DULL_BACK_DIFFUSE = (GLfloat * 4)(0.1, 0.1, 0.1, 1.0)
+DULL_BACK_SPECULAR = (GLfloat * 4)(0.0, 0.0, 0.0, 1.0)
+DULL_BACK_EMISSION = (GLfloat * 4)(0.0, 0.0, 0.0, 1.0)
+
+SHINY_AMBIENT = (GLfloat * 4)(0.1, 0.1, 0.1, 1.0)
+SHINY_DIFFUSE = (GLfloat * 4)(0.95, 0.95, 0.95, 0.6)
+SHINY_SPECULAR = (GLfloat * 4)(10, 10, 10, 1.0)
+SHINY_EMISSION = (GLfloat * 4)(0.0, 0.0, 0.0, 1.0)
+
+GLOWING_AMBIENT = (GLfloat * 4)(0, 0, 0, 1.0)
+GLOWING_DIFFUSE = (GLfloat * 4)(20, 20, 20, 1.0)
+GLOWING_SPECULAR = (GLfloat * 4)(5, 5, 5, 1.0)
+GLOWING_EMISSION = (GLfloat * 4)(1000.0, 1000.0, 1000.0, 0.3)
+
+# Star light parameters
+LIGHT_DIFFUSE = (GLfloat * 4)(8.0, 8.0, 8.0, 1)
+LIGHT_AMBIENT = (GLfloat * 4)(0.1, 0.2, 0.4, 0.5)
+LIGHT_SPECULAR = (GLfloat * 4)(8, 8, 9, 1.0)
+LIGHT_POSITION = (GLfloat * 4)(0, 0, 0, 1)
+
 # Initial window size
 width = 800
 height = 600
@@ -59,21 +147,34 @@ def set_safe_eye_position(new_position):
     :param new_position: an array of three elements, the new eye position
     :return: true if the new position is within boundaries, false otherwise
     """
-    global eye
-    distance_of_new_position_from_sky_center = math.sqrt(
-        (new_position[0] - sky_center[0]) ** 2
-        + (new_position[1] - sky_center[1]) ** 2
-        + (new_position[2] - sky_center[2]) ** 2
-    )
-
-    if distance_of_new_position_from_sky_center <= safety_radius:
+    global eye, camera_dirty
+    # Compare squared distances, there's no need for a square root
+    dx = new_position[0] - sky_center[0]
+    dy = new_position[1] - sky_center[1]
+    dz = new_position[2] - sky_center[2]
+    d2 = dx * dx + dy * dy + dz * dz
+
+    if d2 <= safety_radius_sq:
         eye = new_position
+        camera_dirty = True
         glutPostRedisplay()
         return True
     else:
         return False
 
 
+def update_camera_angles():
+    """
+    Updates the cached sine and cosine of the camera angles theta and phi.
+    Must be called every time theta or phi change
+    :return: nothing
+    """
+    global sin_theta, cos_theta, sin_phi, camera_dirty
+    # A single vectorized call: cos(theta) is computed as sin(theta + 90)
+    sin_theta, cos_theta, sin_phi = np.sin(np.array([theta, theta + 90.0, phi]) * DEG2RAD).tolist()
+    camera_dirty = True
+
+
 def load_texture(fn, has_alpha):
     """
     Load a texture from a position, generates a valid OpenGL texture object
@@ -83,14 +184,109 @@ def load_texture(fn, has_alpha):
     :return: a valid OpenGL texture object
     """
 
-    image = open(fn)
+    return create_texture(open(fn), has_alpha)
+
+
+def load_texture_atlas(file_names):
+    """
+    Packs several textures with alpha channel into a single OpenGL texture (atlas),
+    so that all of them can be drawn without binding another texture
+    :param file_names: list of texture file names
+    :return: a tuple (texture, uv_rects): a valid OpenGL texture object and a dictionary which maps
+    every file name to the (u0, v0, u1, v1) rectangle of texture coordinates it occupies in the atlas
+    """
+    images = [(fn, np.asarray(open(fn).convert("RGBA"), dtype=np.uint8)) for fn in file_names]
+    placements = []
+
+    # Shelf packing: place the images from the tallest to the shortest, left to right,
+    # and open a new shelf below the current one when the row is full
+    x, y, shelf_height, used_width = 0, 0, 0, 0
+    for fn, pixels in sorted(images, key=lambda item: item[1].shape[0], reverse=True):
+        iy, ix = pixels.shape[:2]
+        if x + ix + 2 * atlas_padding > atlas_size[0]:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + iy + 2 * atlas_padding > atlas_size[1]:
+            raise ValueError("The texture atlas is too small to fit " + fn)
+
+        placements.append((fn, pixels, x, y))
+
+        x += ix + 2 * atlas_padding
+        used_width = max(used_width, x)
+        shelf_height = max(shelf_height, iy + 2 * atlas_padding)
+
+    # Only allocate the area actually filled by the images
+    width, height = used_width, y + shelf_height
+    atlas = np.zeros((height, width, 4), dtype=np.uint8)
+    uv_rects = {}
+
+    for fn, pixels, x, y in placements:
+        iy, ix = pixels.shape[:2]
+
+        # Fill the padding by replicating the edges of the image, so that filtering
+        # at its borders never blends in the neighbouring texels
+        padded = np.pad(pixels, ((atlas_padding, atlas_padding), (atlas_padding, atlas_padding), (0, 0)), "edge")
+        atlas[y:y + iy + 2 * atlas_padding, x:x + ix + 2 * atlas_padding] = padded
+
+        # Rows are uploaded bottom to top, so v grows from the bottom of the atlas
+        uv_rects[fn] = (
+            float(x + atlas_padding) / width,
+            1.0 - float(y + atlas_padding + iy) / height,
+            float(x + atlas_padding + ix) / width,
+            1.0 - float(y + atlas_padding) / height
+        )
+
+    return create_texture(fromarray(atlas, "RGBA"), has_alpha=True), uv_rects
+
+
+def upload_through_pbo(fmt, ix, iy, pixels):
+    """
+    Uploads the base level of the currently bound texture through a pixel buffer object (PBO).
+    The flipped pixels are written straight into the mapped buffer, without making them contiguous first,
+    and glTexImage2D sources them from the buffer instead of client memory
+    :param fmt: format of the pixels (GL_RGB or GL_RGBA)
+    :param ix: width of the image
+    :param iy: height of the image
+    :param pixels: NumPy array of pixels, with the bottom row first
+    :return: True if the texture was uploaded, False if PBOs aren't available or the buffer couldn't be mapped
+    """
+    if not (bool(glGenBuffers) and bool(glMapBuffer) and bool(glUnmapBuffer)):
+        return False
+
+    pbo = glGenBuffers(1)
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+    glBufferData(GL_PIXEL_UNPACK_BUFFER, pixels.nbytes, None, GL_STREAM_DRAW)
+
+    address = ctypes.cast(glMapBuffer(GL_PIXEL_UNPACK_BUFFER, GL_WRITE_ONLY), ctypes.c_void_p).value
+    uploaded = bool(address)
+    if uploaded:
+        staging = np.ctypeslib.as_array((ctypes.c_ubyte * pixels.nbytes).from_address(address))
+        staging.reshape(pixels.shape)[...] = pixels
+        uploaded = bool(glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER))
+
+    if uploaded:
+        glTexImage2D(GL_TEXTURE_2D, 0, fmt, ix, iy, 0, fmt, GL_UNSIGNED_BYTE, None)
+
+    # The buffer is released by the driver once the transfer is over
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+    glDeleteBuffers(1, [pbo])
+
+    return uploaded
+
+
+def create_texture(image, has_alpha):
+    """
+    Generates a valid OpenGL texture object out of an image
+    :param image: the image to use as a texture
+    :param has_alpha: True if texture has alpha channel
+    :return: a valid OpenGL texture object
+    """
 
     ix = image.size[0]
     iy = image.size[1]
-    if has_alpha:
-        image = image.tobytes("raw", "RGBA", 0, -1)
-    else:
-        image = image.tobytes("raw", "RGBX", 0, -1)
+    fmt = GL_RGBA if has_alpha else GL_RGB
+
+    # View the pixels as a NumPy array, flipped so that the first row is the bottom one
+    pixels = np.asarray(image.convert("RGBA" if has_alpha else "RGB"), dtype=np.uint8)[::-1]
 
     # Create Texture
     texture = glGenTextures(1)
@@ -98,20 +294,189 @@ def load_texture(fn, has_alpha):
 
     glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
 
-    if has_alpha:
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, image)
+    # Upload the image along with its mipmaps (old drivers need GLU to build them)
+    if not bool(glGenerateMipmap):
+        gluBuild2DMipmaps(GL_TEXTURE_2D, fmt, ix, iy, fmt, GL_UNSIGNED_BYTE, np.ascontiguousarray(pixels))
     else:
-        glTexImage2D(GL_TEXTURE_2D, 0, 3, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, image)
+        if not upload_through_pbo(fmt, ix, iy, pixels):
+            glTexImage2D(GL_TEXTURE_2D, 0, fmt, ix, iy, 0, fmt, GL_UNSIGNED_BYTE, np.ascontiguousarray(pixels))
+        glGenerateMipmap(GL_TEXTURE_2D)
 
     # set the texture's minification properties (mapping textures to bigger areas)
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
     # set the texture's stretching properties (mapping textures to smaller areas)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    # sharpen textures seen at a grazing angle, where supported
+    if glInitTextureFilterAnisotropicEXT():
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAX_ANISOTROPY_EXT, 4.0)
     glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
 
     return texture
 
 
+def compile_sphere(radius, slices, stacks, texture, material_fn=None):
+    """
+    Compiles a textured sphere, along with its material, into a display list.
+    The sphere is tessellated only once, and every frame it can be redrawn (material and texture included)
+    with a single glCallList instead of going through GLU again
+    :param radius: radius of the sphere
+    :param slices: number of subdivisions around the z axis (longitude)
+    :param stacks: number of subdivisions along the z axis (latitude)
+    :param texture: the texture to map on the sphere
+    :param material_fn: a function loading the material of the sphere, if it needs one
+    :return: the id of the compiled display list
+    """
+    sphere_list = glGenLists(1)
+    glNewList(sphere_list, GL_COMPILE)
+    if material_fn is not None:
+        material_fn()
+    glBindTexture(GL_TEXTURE_2D, texture)
+    gluSphere(quadratic, radius, slices, stacks)
+    glEndList()
+
+    return sphere_list
+
+
+def build_crossed_quads(w, h, faces, uv_rect):
+    """
+    Builds (only once for every shape) the geometry of a star of rectangles turning around the y axis,
+    and uploads it to a static vertex buffer object (VBO) in video memory
+    :param w: width of the rectangles
+    :param h: height of the rectangles
+    :param faces: number of rectangles
+    :param uv_rect: (u0, v0, u1, v1) rectangle of texture coordinates to map on every rectangle
+    :return: a tuple (vbo, vertex_count). The VBO interleaves vertex, normal and texture coordinates
+    (8 floats per vertex), four vertices per face
+    """
+    key = (w, h, faces, uv_rect)
+    if key not in crossed_quads_cache:
+        # Every face is rotated around y by an increasing multiple of turn with respect to the previous one
+        turn = 180 // faces
+        steps = np.arange(faces)
+        angles = np.radians(turn * steps * (steps + 1) / 2.0)
+        cos, sin = np.cos(angles), np.sin(angles)
+        zeros, ones = np.zeros(faces), np.ones(faces)
+
+        # One rotation matrix around the y axis for each face
+        rotations = np.stack([
+            np.stack([cos, zeros, sin], axis=-1),
+            np.stack([zeros, ones, zeros], axis=-1),
+            np.stack([-sin, zeros, cos], axis=-1)
+        ], axis=1)
+
+        # The rectangle of width w and height h, standing on the x axis
+        quad = np.array([
+            [-(w / 2.0), 0.0, 0.0],
+            [(w / 2.0), 0.0, 0.0],
+            [(w / 2.0), h, 0.0],
+            [-(w / 2.0), h, 0.0]
+        ])
+
+        vertices = np.einsum("fij,vj->fvi", rotations, quad).reshape(-1, 3).astype(np.float32)
+        # The normal (0, 1, 0) is left unchanged by rotations around y
+        normals = np.tile(np.array([0.0, 1.0, 0.0], dtype=np.float32), (4 * faces, 1))
+        u0, v0, u1, v1 = uv_rect
+        texcoords = np.tile(np.array([[u0, v0], [u1, v0], [u1, v1], [u0, v1]], dtype=np.float32), (faces, 1))
+
+        # Interleave the vertex attributes and upload them once
+        data = np.ascontiguousarray(np.hstack([vertices, normals, texcoords]))
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        crossed_quads_cache[key] = (vbo, len(data))
+
+    return crossed_quads_cache[key]
+
+
+def select_lod(lod_lists, distance_sq):
+    """
+    Selects the display list with the right level of detail for an object at a given distance from the eye
+    :param lod_lists: list of (maximum squared distance, display list) tuples, from the nearest to the farthest
+    level. The last maximum distance is ignored, that level is used at any greater distance
+    :param distance_sq: squared distance of the object from the eye
+    :return: the id of the display list to draw
+    """
+    for max_distance_sq, lod_list in lod_lists[:-1]:
+        if distance_sq < max_distance_sq:
+            return lod_list
+
+    return lod_lists[-1][1]
+
+
+def compile_cylinder(base, top, height, slices, stacks):
+    """
+    Tessellates a cylinder once and stores it in a display list, so that it can be
+    redrawn every frame with a single glCallList instead of going through GLU again
+    :param base: radius of the cylinder at z = 0
+    :param top: radius of the cylinder at z = height
+    :param height: height of the cylinder
+    :param slices: number of subdivisions around the z axis
+    :param stacks: number of subdivisions along the z axis
+    :return: the id of the compiled display list
+    """
+    cylinder_list = glGenLists(1)
+    glNewList(cylinder_list, GL_COMPILE)
+    gluCylinder(quadratic, base, top, height, slices, stacks)
+    glEndList()
+
+    return cylinder_list
+
+
+def _sphere_matrix(sphere_center, dest_longitude, dest_latitude, dest_height, dest_orientation):
+    """
+    Computes the transformation applied by position_on_sphere as a single 4x4 matrix,
+    to be applied with glMultMatrixf. Meant for objects which never move over the sphere:
+    their matrix is computed once and reused every frame
+    :param sphere_center: vector of three coordinates, center of the sphere
+    :param dest_longitude: longitude of the point on the sphere's surface (in degrees)
+    :param dest_latitude: latitude of the point on the sphere's surface (in degrees)
+    :param dest_height: distance of the point from the sphere center
+    :param dest_orientation: orientation of the final reference system
+    :return: the matrix as a GLfloat array of 16 elements, in column-major order
+    """
+    angles = np.radians([dest_longitude - 90, dest_latitude - 90, dest_orientation])
+    (sin_lon, sin_lat, sin_orient), (cos_lon, cos_lat, cos_orient) = np.sin(angles), np.cos(angles)
+
+    # 1) Move to the sphere center
+    move_to_center = np.identity(4)
+    move_to_center[:3, 3] = sphere_center
+
+    # 2) Rotate around y by a degree of longitude - 90
+    longitude_rotation = np.array([
+        [cos_lon, 0.0, sin_lon, 0.0],
+        [0.0, 1.0, 0.0, 0.0],
+        [-sin_lon, 0.0, cos_lon, 0.0],
+        [0.0, 0.0, 0.0, 1.0]
+    ])
+
+    # 3) Rotate around z by a degree of latitude - 90
+    latitude_rotation = np.array([
+        [cos_lat, -sin_lat, 0.0, 0.0],
+        [sin_lat, cos_lat, 0.0, 0.0],
+        [0.0, 0.0, 1.0, 0.0],
+        [0.0, 0.0, 0.0, 1.0]
+    ])
+
+    # 4) Translate the reference system up to the desired height
+    move_up = np.identity(4)
+    move_up[1, 3] = dest_height
+
+    # 5) Perform the final rotation around y to set the final orientation
+    orientation_rotation = np.array([
+        [cos_orient, 0.0, sin_orient, 0.0],
+        [0.0, 1.0, 0.0, 0.0],
+        [-sin_orient, 0.0, cos_orient, 0.0],
+        [0.0, 0.0, 0.0, 1.0]
+    ])
+
+    matrix = move_to_center.dot(longitude_rotation).dot(latitude_rotation).dot(move_up).dot(orientation_rotation)
+
+    # OpenGL expects matrices in column-major order
+    return (GLfloat * 16)(*matrix.T.flatten())
+
+
 def position_on_sphere(
         sphere_center,
         dest_longitude,
@@ -123,7 +488,8 @@ def position_on_sphere(
     Position the reference system over a destination point on a sphere.
     The y axis will correspond to the normal of the sphere at the point.
     The x axis will be orthogonal to the y axis at a specific orientation.
-    The z axis will be orthogonal to the x-y plane
+    The z axis will be orthogonal to the x-y plane.
+    Used for objects moving over the sphere, static ones use a matrix from _sphere_matrix
 
     :param sphere_center: vector of three coordinates, center of the sphere
     :param dest_longitude: longitude of the point on the sphere's surface
@@ -166,8 +532,12 @@ def init(width, height):  # We call this right after our OpenGL window is create
     :param height: height of the window
     :return:
     """
-    global quadratic, earth_texture, sky_texture, glass_texture, star_texture
-    global planet_texture, rose_texture, baobab_texture, prince_texture, pizza_texture
+    global quadratic, earth_texture, sky_texture, star_texture, planet_texture
+    global sprite_atlas, glass_uv, rose_uv, baobab_uv, prince_uv
+    global sky_list, star_list, planet_lod_lists, satellite_list, rose_bowl_list, rose_stem_list
+    global scene_sprites, scene_overlays, sprite_shader
+    global PRINCE_MTX, ROSE_MTX, BAOBAB_MTX
+    global last_time
 
     # Enables Depth Testing.
     # Makes 3D drawing work when something is in front of something else
@@ -180,21 +550,89 @@ def init(width, height):  # We call this right after our OpenGL window is create
     star_texture = load_texture("textures/star.jpg", has_alpha=False)
     sky_texture = load_texture("textures/sky.png", has_alpha=False)
     planet_texture = load_texture("./textures/moon.png", has_alpha=False)
-    rose_texture = load_texture("./textures/rose_nocup.png", has_alpha=True)
-    baobab_texture = load_texture("./textures/baobab.png", has_alpha=True)
-    prince_texture = load_texture("./textures/lp.png", has_alpha=True)
-    pizza_texture = load_texture("./textures/pizza.png", has_alpha=False)
-    glass_texture = load_texture("./textures/glass.png", has_alpha=True)
+
+    # All the textures with transparency share the same atlas
+    sprite_atlas, uv_rects = load_texture_atlas([
+        "./textures/rose_nocup.png",
+        "./textures/baobab.png",
+        "./textures/lp.png",
+        "./textures/glass.png"
+    ])
+    rose_uv = uv_rects["./textures/rose_nocup.png"]
+    baobab_uv = uv_rects["./textures/baobab.png"]
+    prince_uv = uv_rects["./textures/lp.png"]
+    glass_uv = uv_rects["./textures/glass.png"]
 
     # Set up quadric and its normals for correct light shading
     quadratic = gluNewQuadric()
     gluQuadricNormals(quadratic, GLU_SMOOTH)  # Create Smooth Normals (NEW)
     gluQuadricTexture(quadratic, GL_TRUE)  # Create Texture Coords (NEW)
 
+    # Tessellate the spheres only once, they never change shape nor look
+    sky_list = compile_sphere(sky_radius, 32, 16, sky_texture)
+    star_list = compile_sphere(planet_radius, 16, 16, star_texture, load_glowing_material)
+    satellite_list = compile_sphere(satellite_radius, 16, 16, earth_texture, load_planet_material)
+    # The planet has one display list for each level of detail, selected comparing squared distances
+    planet_lod_lists = [
+        (
+            max_distance * max_distance if max_distance is not None else None,
+            compile_sphere(planet_radius, detail, detail, planet_texture, load_planet_material)
+        )
+        for max_distance, detail in planet_lod
+    ]
+
+    # The glass bowl over the rose is made of two cylinders, which never change shape either
+    rose_bowl_list = compile_cylinder(rose_width, rose_width, 3 * rose_height / 4, 64, 64)
+    rose_stem_list = compile_cylinder(rose_width, rose_width / 7, rose_height / 2, 32, 32)
+
+    # The transparent objects are drawn with a shader which discards their fully transparent texels
+    sprite_shader = shaders.compileProgram(
+        shaders.compileShader(SPRITE_FRAGMENT_SHADER, GL_FRAGMENT_SHADER)
+    )
+
+    # The transparent objects on the planet never change either: describe them once,
+    # along with their position on the planet.
+    # the Little prince on the planet pole
+    PRINCE_MTX = _sphere_matrix(sky_center, 180, 0, planet_radius - 0.1, 0)
+    # the Rose
+    ROSE_MTX = _sphere_matrix(sky_center, 60, 30, planet_radius - 0.1, 0)
+    # the baobab
+    BAOBAB_MTX = _sphere_matrix(sky_center, -60, -30, planet_radius - 0.1, 0)
+
+    # Sprites are drawn by draw_all_sprites
+    scene_sprites = [
+        (PRINCE_MTX, 0.7, 1.2, prince_uv, 1, load_shiny_material),
+        (ROSE_MTX, rose_width, rose_height, rose_uv, 10, load_dull_material),
+        (BAOBAB_MTX, 2, 3, baobab_uv, 4, load_dull_material)
+    ]
+    # and the glass bowl over the Rose is drawn after them
+    scene_overlays = [lambda: draw_rose(ROSE_MTX)]
+
+    # Texturing is always on
     glEnable(GL_TEXTURE_2D)
 
-    glTexGeni(GL_S, GL_TEXTURE_GEN_MODE, GL_SPHERE_MAP)
-    glTexGeni(GL_T, GL_TEXTURE_GEN_MODE, GL_SPHERE_MAP)
+    # Set the default color for color buffers
+    glClearColor(1.0, 1.0, 1.0, 1.0)
+
+    # Setup the lights
+    glEnable(GL_COLOR_MATERIAL)
+    glEnable(GL_LIGHTING)  # Enable lighting
+    glEnable(GL_LIGHT0)  # Enable light #0
+    glEnable(GL_NORMALIZE)  # Automatically normalize normals
+
+    # Set light parameters (the position is set every frame by draw_starlight)
+    # This is the diffuse component of the point-shaped light source.
+    # It irradiates in all directions
+    glLightfv(GL_LIGHT0, GL_DIFFUSE, LIGHT_DIFFUSE)
+
+    # This is the ambient component of the light source. It illuminates dark polygons
+    glLightfv(GL_LIGHT0, GL_AMBIENT, LIGHT_AMBIENT)
+
+    # This is the specular component of the light source. It generates reflections on specular materials
+    glLightfv(GL_LIGHT0, GL_SPECULAR, LIGHT_SPECULAR)
+
+    # Light up polygons in a different way if they are illuminated from the front face or the back face
+    glLightModelf(GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE)
 
     # Set The Projection Matrix
     glMatrixMode(GL_PROJECTION)
@@ -205,6 +643,9 @@ def init(width, height):  # We call this right after our OpenGL window is create
     # Back to model view matrix
     glMatrixMode(GL_MODELVIEW)
 
+    # Start counting animation time from now
+    last_time = time.time()
+
 
 # ---------
 # CALLBACKS
@@ -216,34 +657,38 @@ def display():
     A callback to display graphics. Draws the whole 3D scene
     :return: nothing
     """
-    global eye_direction
-    global zrot, texture, quadratic, earth_texture
+    global eye_direction, camera_dirty, planet_list
+    global zrot, last_time
 
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)  # Clear The Screen And The Depth Buffer
 
-    # Set the default color for color buffers
-    glClearColor(1.0, 1.0, 1.0, 1.0)
-
     # Reset the position
     glLoadIdentity()
 
-    # Set the camera (eye) position and direction
-    eye_direction = (
-        eye[0] - math.sin(theta * 2 * math.pi / 360.0),
-        eye[1] + math.sin(phi * 2 * math.pi / 360),
-        eye[2] - math.cos(theta * 2 * math.pi / 360.0)
-    )
+    # Set the camera (eye) position and direction, recomputing the direction only if the camera moved
+    if camera_dirty:
+        eye_direction = (
+            eye[0] - sin_theta,
+            eye[1] + sin_phi,
+            eye[2] - cos_theta
+        )
+
+        # The planet is as detailed as its distance from the eye requires (it's at the sky centre)
+        dx = eye[0] - sky_center[0]
+        dy = eye[1] - sky_center[1]
+        dz = eye[2] - sky_center[2]
+        planet_list = select_lod(planet_lod_lists, dx * dx + dy * dy + dz * dz)
+
+        camera_dirty = False
     gluLookAt(
         eye[0], eye[1], eye[2],
         eye_direction[0], eye_direction[1], eye_direction[2],
         0.0, 1.0, 0.0
     )
 
-    # Setup the lights
-    glEnable(GL_COLOR_MATERIAL)
-    glEnable(GL_LIGHTING)  # Enable lighting
-    glEnable(GL_LIGHT0)  # Enable light #0
-    glEnable(GL_NORMALIZE)  # Automatically normalize normals
+    # Lights off, so that the sky and the star are always visible
+    # and don't change in accordance with light sources
+    glDisable(GL_LIGHTING)
 
     # Draw the sky dome
     draw_sky()
@@ -251,16 +696,32 @@ def display():
     # Draw the star and its light
     draw_starlight()
 
+    # Lights back on
+    glEnable(GL_LIGHTING)
+
     # Draw the planet at the center of the scene
     draw_planet()
 
     # Increase z rotation of all rotating bodies (planet, satellite, sky dome, star...)
-    zrot += delta_rot
+    # according to the time elapsed, so that the animation speed doesn't depend on the frame rate
+    now = time.time()
+    zrot += delta_rot * (now - last_time) * TARGET_HZ
+    last_time = now
 
     #  Since this is double buffered, swap the buffers to display what just got drawn.
     glutSwapBuffers()
 
 
+def tick(value):
+    """
+    Timer callback which asks for a redraw of the scene at the target frame rate
+    :param value: value registered with the timer (unused)
+    :return: nothing
+    """
+    glutPostRedisplay()
+    glutTimerFunc(frame_interval, tick, 0)
+
+
 def resize_scene(width, height):
     """
     Resizes the whole scene and perspective as the windows size is changed
@@ -295,20 +756,20 @@ def keyboard(key, x, y):
     if key == chr(27):
         sys.exit()
     if key == 'w':  # move forward
-        eye_new[0] -= math.sin(theta * 2 * math.pi / 360.0)  # radians conversion of angle theta
-        eye_new[2] -= math.cos(theta * 2 * math.pi / 360.0)
+        eye_new[0] -= sin_theta
+        eye_new[2] -= cos_theta
 
     if key == 's':  # move back
-        eye_new[0] += math.sin(theta * 2 * math.pi / 360.0)
-        eye_new[2] += math.cos(theta * 2 * math.pi / 360.0)
+        eye_new[0] += sin_theta
+        eye_new[2] += cos_theta
 
     if key == 'a':  # move left
-        eye_new[0] -= math.cos(theta * 2 * math.pi / 360.0)
-        eye_new[2] += math.sin(theta * 2 * math.pi / 360.0)
+        eye_new[0] -= cos_theta
+        eye_new[2] += sin_theta
 
     if key == 'd':  # move right
-        eye_new[0] += math.cos(theta * 2 * math.pi / 360.0)
-        eye_new[2] -= math.sin(theta * 2 * math.pi / 360.0)
+        eye_new[0] += cos_theta
+        eye_new[2] -= sin_theta
 
     set_safe_eye_position(eye_new)
     return
@@ -329,20 +790,24 @@ def special_pressed(key, x, y):
     global theta, eye_rotation_delta, phi
     if key == GLUT_KEY_RIGHT:  # look right
         theta = (theta - eye_rotation_delta) % 360
+        update_camera_angles()
         glutPostRedisplay()
         return
     if key == GLUT_KEY_LEFT:  # look left
         theta = (theta + eye_rotation_delta) % 360
+        update_camera_angles()
         glutPostRedisplay()
         return
     if key == GLUT_KEY_UP:  # look up
         if phi < 90:
             phi += eye_rotation_delta
+        update_camera_angles()
         glutPostRedisplay()
         return
     if key == GLUT_KEY_DOWN:  # look down
         if phi > -90:
             phi -= eye_rotation_delta
+        update_camera_angles()
         glutPostRedisplay()
         return
 
@@ -358,10 +823,10 @@ def load_planet_material():
     :return: nothing
     """
     # Set the material
-    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, [0.1, 0.1, 0.1, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, [10, 10, 10, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, [5, 5, 5, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION, [0, 0, 0, 1.0])
+    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, PLANET_AMBIENT)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, PLANET_DIFFUSE)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, PLANET_SPECULAR)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION, PLANET_EMISSION)
     glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, 70.0)
 
 
@@ -370,16 +835,16 @@ def load_dull_material():
     Loads a good material to represent objects with a matte texture that doesn't reflect light
     :return:
     """
-    glMaterialfv(GL_FRONT, GL_AMBIENT, [0.1, 0.1, 0.1, 1.0])
-    glMaterialfv(GL_FRONT, GL_DIFFUSE, [1, 1, 1, 1.0])
-    glMaterialfv(GL_FRONT, GL_SPECULAR, [0.1, 0.1, 0.1, 1.0])
-    glMaterialfv(GL_FRONT, GL_EMISSION, [0.0, 0.0, 0.0, 1.0])
-    glMaterialfv(GL_FRONT, GL_SHININESS, 10)
-    glMaterialfv(GL_BACK, GL_AMBIENT, [0.1, 0.1, 0.1, 1.0])
-    glMaterialfv(GL_BACK, GL_DIFFUSE, [0.1, 0.1, 0.1, 1.0])
-    glMaterialfv(GL_BACK, GL_SPECULAR, [0.0, 0.0, 0.0, 1.0])
-    glMaterialfv(GL_BACK, GL_EMISSION, [0.0, 0.0, 0.0, 1.0])
-    glMaterialfv(GL_BACK, GL_SHININESS, 0)
+    glMaterialfv(GL_FRONT, GL_AMBIENT, DULL_FRONT_AMBIENT)
+    glMaterialfv(GL_FRONT, GL_DIFFUSE, DULL_FRONT_DIFFUSE)
+    glMaterialfv(GL_FRONT, GL_SPECULAR, DULL_FRONT_SPECULAR)
+    glMaterialfv(GL_FRONT, GL_EMISSION, DULL_FRONT_EMISSION)
+    glMaterialf(GL_FRONT, GL_SHININESS, 10)
+    glMaterialfv(GL_BACK, GL_AMBIENT, DULL_BACK_AMBIENT)
+    glMaterialfv(GL_BACK, GL_DIFFUSE, DULL_BACK_DIFFUSE)
+    glMaterialfv(GL_BACK, GL_SPECULAR, DULL_BACK_SPECULAR)
+    glMaterialfv(GL_BACK, GL_EMISSION, DULL_BACK_EMISSION)
+    glMaterialf(GL_BACK, GL_SHININESS, 0)
 
 
 def load_shiny_material():
@@ -387,11 +852,11 @@ def load_shiny_material():
     Loads a good material to represent objects with a polished texture that reflects light
     :return: nothing
     """
-    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, [0.1, 0.1, 0.1, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, [0.95, 0.95, 0.95, 0.6])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, [10, 10, 10, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION, [0.0, 0.0, 0.0, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SHININESS, 120)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, SHINY_AMBIENT)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, SHINY_DIFFUSE)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, SHINY_SPECULAR)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION, SHINY_EMISSION)
+    glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, 120)
 
 
 def load_glowing_material():
@@ -399,28 +864,27 @@ def load_glowing_material():
     Loads a good material to represent objects which glow
     :return: nothing
     """
-    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, [0, 0, 0, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, [20, 20, 20, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, [5, 5, 5, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION, [1000.0, 1000.0, 1000.0, 0.3])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SHININESS, 128)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, GLOWING_AMBIENT)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, GLOWING_DIFFUSE)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, GLOWING_SPECULAR)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION, GLOWING_EMISSION)
+    glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, 128)
 
 # ---------------
 # DRAWING METHODS
 # ---------------
 
 
-def draw_crossed_textures(longitude, latitude, height, w, h, texture, faces):
+def draw_crossed_textures(matrix, w, h, uv_rect, faces):
     """
     Draws a texture with alpha channel (transparency) over a star of rectangles, to mimic a 3D object.
     The object is drawn on the surface of the main planet
-    over the spot specified by longitude, latitude and height.
-    :param longitude: horizontal angle from the fundamental meridian
-    :param latitude: vertical angle from the equator
-    :param height: height from the planet centre
+    over the spot given by its position matrix (see _sphere_matrix).
+    Blending, texture and vertex arrays must already be set up by draw_all_sprites.
+    :param matrix: position of the object on the planet, as computed by _sphere_matrix
     :param w: width of the rectangles
     :param h: height of the rectangles
-    :param texture: a texture with alpha channel (transparency)
+    :param uv_rect: (u0, v0, u1, v1) rectangle of texture coordinates to use within the sprite atlas
     :param faces: number of faces to represent
     :return: nothing
     """
@@ -428,148 +892,129 @@ def draw_crossed_textures(longitude, latitude, height, w, h, texture, faces):
     glPushMatrix()
 
     # Get on the right spot on the planet
-    position_on_sphere(
-        sky_center,
-        longitude, latitude, height, 0
-    )
+    glMultMatrixf(matrix)
 
-    # Enable alpha blending
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-    glEnable(GL_ALPHA_TEST)
-    glAlphaFunc(GL_GREATER, 0.0)
+    # Map the texture to all the rectangles of width w and height h with a single draw call
+    vbo, vertex_count = build_crossed_quads(w, h, faces, uv_rect)
+    stride = 8 * 4  # 8 floats of 4 bytes each per vertex
 
-    # Load correct texture
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-    glBindTexture(GL_TEXTURE_2D, texture)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+    glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+    glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(3 * 4))
+    glTexCoordPointer(2, GL_FLOAT, stride, ctypes.c_void_p(6 * 4))
+    glDrawArrays(GL_QUADS, 0, vertex_count)
+
+    # Back to original position
+    glPopMatrix()
 
-    # Map the texture to a rectangle of width w and height h
 
-    turn = 180 / faces
+def sprite_depth(modelview, matrix):
+    """
+    Computes how far an object on the planet is in front of the camera
+    :param modelview: the current modelview matrix, as read from OpenGL (column-major 4x4 array)
+    :param matrix: position of the object on the planet, as computed by _sphere_matrix
+    :return: the z coordinate of the object in eye space (the lower, the farther)
+    """
+    # z row of the modelview matrix times the translation column of the object matrix
+    return (
+        modelview[0][2] * matrix[12]
+        + modelview[1][2] * matrix[13]
+        + modelview[2][2] * matrix[14]
+        + modelview[3][2] * matrix[15]
+    )
 
-    for i in range(turn, 181, turn):
-        # Start drawing a rectangle and define its normal
-        glPushMatrix()
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 1.0, 0.0)
 
-        # Map the corners of the rectangle to the texture
-        glTexCoord2f(0.0, 0.0)
-        glVertex3f(-(w / 2), 0.0, 0.0)
+def draw_all_sprites(sprites, overlays=()):
+    """
+    Draws all the transparent objects on the planet in a single pass:
+    blending, the sprite shader and the sprite atlas are set up once, then sprites are drawn from the farthest
+    to the nearest one, so that transparency is rendered correctly.
+    :param sprites: list of (matrix, w, h, uv_rect, faces, material_fn) tuples,
+    the arguments of draw_crossed_textures plus a function loading the material of the sprite
+    :param overlays: functions drawing other transparent objects, called after all the sprites
+    :return: nothing
+    """
+    # Enable alpha blending, the shader discards fully transparent texels
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    glUseProgram(sprite_shader)
 
-        glTexCoord2f(1.0, 0.0)
-        glVertex3f((w / 2), 0.0, 0.0)
+    # All the sprites share the same texture
+    glBindTexture(GL_TEXTURE_2D, sprite_atlas)
 
-        glTexCoord2f(1.0, 1.0)
-        glVertex3f((w / 2), h, 0.0)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
 
-        glTexCoord2f(0.0, 1.0)
-        glVertex3f(-(w / 2), h, 0.0)
+    # Back to front
+    modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
+    for matrix, w, h, uv_rect, faces, material_fn in sorted(
+            sprites, key=lambda sprite: sprite_depth(modelview, sprite[0])
+    ):
+        material_fn()
+        draw_crossed_textures(matrix, w, h, uv_rect, faces)
 
-        # End the rectangle drawing and mapping
-        glEnd()
-        glPopMatrix()
+    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
 
-        # Rotate the reference system to draw the next face
-        glRotatef(i, 0.0, 1.0, 0.0)
+    for overlay in overlays:
+        overlay()
 
-    # Disable alpha blending
-    glDisable(GL_ALPHA_TEST)
+    # Back to the fixed-function pipeline, disable alpha blending
+    glUseProgram(0)
     glDisable(GL_BLEND)
 
-    # Back to original position
-    glPopMatrix()
-
 
 def draw_sky():
     """
-    Draw the sky dome
+    Draw the sky dome. Lighting must be disabled
     :return:
     """
-    # Disable the lighting so that the sky is always visible and doesn't change in accordance with light sources
-    glDisable(GL_LIGHTING)
-
     glPushMatrix()  # 1: context for the turning sky
 
-    # Disable depth mask, enable texturing
+    # Disable depth mask
     glDepthMask(GL_FALSE)
-    glEnable(GL_TEXTURE_2D)
-    glEnable(GL_TEXTURE_GEN_T)
-    glBindTexture(GL_TEXTURE_2D, sky_texture)
 
     # Rotate the texture and the sky dome
-    glTranslatef(0.0, 0.0, 0.0)
     glRotatef(90, 1.0, 0.0, 0.0)
     glRotatef(sky_rotation_factor * zrot, 0.0, 0.1, 1.0)
 
     # Draw the sky dome
-    gluSphere(quadratic, sky_radius, 64, 64)
+    glCallList(sky_list)
 
-    # Disable texturing and re-enable depth mask
-    glDisable(GL_TEXTURE_GEN_S)
-    glDisable(GL_TEXTURE_GEN_T)
+    # Re-enable depth mask
     glDepthMask(GL_TRUE)
 
     glPopMatrix()  # 1: context for the turning sky
 
-    # Re-enable lighting
-    glEnable(GL_LIGHTING)
-
 
 def draw_starlight():
     """
-    Draws a star, which also doubles as a diffuse light source
+    Draws a star, which also doubles as a diffuse light source. Lighting must be disabled,
+    the other light parameters are set once by init
     :return:
     """
     # We start from the sky centre
 
-    # Set light parameters
-    # This is the diffuse component of the point-shaped light source.
-    # It irradiates in all directions
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, (8.0, 8.0, 8.0, 1))
-
-    # This is the ambient component of the light source. It illuminates dark polygons
-    glLightfv(GL_LIGHT0, GL_AMBIENT, (0.1, 0.2, 0.4, 0.5))
-
-    # This is the specular component of the light source. It generates reflections on specular materials
-    glLightfv(GL_LIGHT0, GL_SPECULAR, [8, 8, 9, 1.0])
-
-    # Light up polygons in a different way if they are illuminated from the front face or the back face
-    glLightModelf(GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE)
-
     # Set the light that points towards the center of the galaxy, but somewhere far away in the distance
 
     glPushMatrix()  # 1: Move to an orbit fixed within the sky
 
     position_on_sphere(sky_center, -sky_rotation_factor * zrot, 0, sky_radius * star_distance, 0)
-    glLightfv(GL_LIGHT0, GL_POSITION, [0, 0, 0, 1])
-
-    # Lights off, so that the star can be painted
-    glDisable(GL_LIGHTING)
+    glLightfv(GL_LIGHT0, GL_POSITION, LIGHT_POSITION)
 
     glDepthMask(GL_FALSE)
     glPushMatrix()  # 2: star rotation context
 
-    # Load the star material
-    load_glowing_material()
-
-    glEnable(GL_TEXTURE_2D)
-    glEnable(GL_TEXTURE_GEN_T)
-    glBindTexture(GL_TEXTURE_2D, star_texture)
-    glTranslatef(0.0, 0.0, 0.0)
     glRotatef(2 * zrot, 0, 0.0, 1.0)
 
-    # Draw the star
-    gluSphere(quadratic, planet_radius, 32, 32)
+    # Draw the star, with its material and texture
+    glCallList(star_list)
     glPopMatrix()  # 2: star rotation context
-    glDisable(GL_TEXTURE_GEN_S)
-    glDisable(GL_TEXTURE_GEN_T)
     glDepthMask(GL_TRUE)
 
-    # Lights back on
-    glEnable(GL_LIGHTING)
-
     glPopMatrix()  # 1: Move back to the sky centre
 
 
@@ -597,27 +1042,11 @@ def draw_planet():
     # Rotate the planet On its rotation Axis
     glRotatef(zrot, 0.0, 0.0, 1.0)
 
-    # Set the material
-    load_planet_material()
-
-    # Enable mapping
-    glEnable(GL_TEXTURE_2D)
-    glEnable(GL_TEXTURE_GEN_T)
-    glBindTexture(GL_TEXTURE_2D, planet_texture)
-
-    # Draw the planet and stop texturing
-    gluSphere(quadratic, planet_radius, 64, 64)
-    glDisable(GL_TEXTURE_GEN_S)
-    glDisable(GL_TEXTURE_GEN_T)
+    # Draw the planet, with its material and texture, at the level of detail chosen when the camera moved
+    glCallList(planet_list)
 
-    # Draw the Little prince on the planet pole
-    draw_little_prince(180, 0, planet_radius - 0.1, w=0.7, h=1.2)
-
-    # Draw the Rose (it's done here to correctly render transparency)
-    draw_rose(60, 30, planet_radius - 0.1, w=0.5, h=0.8)
-
-    # Draw the baobab
-    draw_baobab(-60, -30, planet_radius - 0.1, w=2, h=3)
+    # Draw the transparent objects (it's done here to correctly render transparency)
+    draw_all_sprites(scene_sprites, scene_overlays)
 
     glPopMatrix()  # 1: planet tilt and rotate
 
@@ -633,9 +1062,6 @@ def draw_satellite(longitude, latitude, height):
     :param height: height from the planet centre
     :return: nothing
     """
-    # Setup the correct material to draw the planet
-    load_planet_material()
-
     # Get to the right position
     glPushMatrix()  # 1: Saving the original position
     position_on_sphere(
@@ -646,60 +1072,24 @@ def draw_satellite(longitude, latitude, height):
     # Satellite axis rotation
     glRotatef(zrot, 0.0, 0.0, 1.0)
 
-    # Texturing
-    glEnable(GL_TEXTURE_2D)
-    glEnable(GL_TEXTURE_GEN_T)
-    glBindTexture(GL_TEXTURE_2D, earth_texture)
-
-    # Drawing the sphere
-    gluSphere(quadratic, satellite_radius, 64, 64)
+    # Drawing the sphere, with its material and texture
+    glCallList(satellite_list)
 
-    # Disabling texture mapping
-    glDisable(GL_TEXTURE_GEN_S)
-    glDisable(GL_TEXTURE_GEN_T)
     glPopMatrix()   # 1: Back to the original position
 
 
-def draw_little_prince(longitude, latitude, height, w, h):
-    """
-    Draw the Little Prince on the planet at specified coordinates and height, and with a specific size
-    :param longitude: horizontal angle from the fundamental meridian
-    :param latitude: vertical angle from the equator
-    :param height: height from the planet centre
-    :param w: width of the drawn element
-    :param h: height of the drawn element
-    :return: nothing
-    """
-    # Set the material
-    load_shiny_material()
-
-    # Draw
-    draw_crossed_textures(longitude, latitude, height, w, h, prince_texture, 1)
-
-
-def draw_rose(longitude, latitude, height, w, h):
+def draw_rose(matrix):
     """
-    Draw a rose on the planet at specified coordinates and height, and with a specific size
-    :param longitude: horizontal angle from the fundamental meridian
-    :param latitude: vertical angle from the equator
-    :param height: height from the planet centre
-    :param w: width of the drawn element
-    :param h: height of the drawn element
+    Draw the glass bowl over the rose on the planet, at the position given by its matrix.
+    Its size is given by rose_width and rose_height. The rose itself is drawn as a sprite
+    by draw_all_sprites, which also sets up blending before calling this function.
+    :param matrix: position of the rose on the planet, as computed by _sphere_matrix
     :return: nothing
     """
-    # Load the correct material for the rose
-    load_dull_material()
-
-    # draw the rose
-    draw_crossed_textures(longitude, latitude, height, w, h, rose_texture, 10)
-
     # draw the cup over the rose
     glPushMatrix()  # 1: saving the position at the base of the rose
     # Get on the right spot over the planet
-    position_on_sphere(
-        sky_center,
-        longitude, latitude, height, 0
-    )
+    glMultMatrixf(matrix)
 
     # Rotation to correctly position the cylinder as orthogonal to the planet
     glRotatef(-90, 1.0, 0.0, 0.0)
@@ -707,48 +1097,27 @@ def draw_rose(longitude, latitude, height, w, h):
     # Set up the glass like material
     load_shiny_material()
 
-    # Enable alpha blending
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-    glEnable(GL_ALPHA_TEST)
-    glAlphaFunc(GL_GREATER, 0.0)
-
-    # Load the correct texture for the glass like material
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-    glBindTexture(GL_TEXTURE_2D, glass_texture)
+    # Map the texture coordinates of the cylinders to the glass rectangle in the atlas
+    glMatrixMode(GL_TEXTURE)
+    glPushMatrix()
+    glTranslatef(glass_uv[0], glass_uv[1], 0.0)
+    glScalef(glass_uv[2] - glass_uv[0], glass_uv[3] - glass_uv[1], 1.0)
+    glMatrixMode(GL_MODELVIEW)
 
     # Draw the glass bowl
-    gluCylinder(quadratic, w, w, 3 * h / 4, 64, 64)
-    glTranslatef(0.0, 0.0, 3 * h / 4)
-    gluCylinder(quadratic, w, w / 7, h / 2, 32, 32)
+    glCallList(rose_bowl_list)
+    glTranslatef(0.0, 0.0, 3 * rose_height / 4)
+    glCallList(rose_stem_list)
 
-    # Disable alpha blending
-    glDisable(GL_ALPHA_TEST)
-    glDisable(GL_BLEND)
+    # Restore the texture coordinates
+    glMatrixMode(GL_TEXTURE)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
 
     # End
     glPopMatrix()
 
 
-def draw_baobab(longitude, latitude, height, w, h):
-    """
-    Draw a baobab on the planet at specified coordinates and height, and with a specific size
-    :param longitude: horizontal angle from the fundamental meridian
-    :param latitude: vertical angle from the equator
-    :param height: height from the planet centre
-    :param w: width of the drawn element
-    :param h: height of the drawn element
-    :return: nothing
-    """
-
-    # Set the material
-    load_dull_material()
-
-    # Draw
-    draw_crossed_textures(longitude, latitude, height, w, h, baobab_texture, 4)
-
-
 # ----------
 # MAIN BLOCK
 # ----------
@@ -783,8 +1152,8 @@ def main():
     # Uncomment this line to get full screen.
     # glutFullScreen()
 
-    # When we are doing nothing, redraw the scene.
-    glutIdleFunc(display)
+    # Redraw the scene at the target frame rate.
+    glutTimerFunc(frame_interval, tick, 0)
 
     # Register the function called when our window is resized.
     glutReshapeFunc(resize_scene)